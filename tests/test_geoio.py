@@ -1,7 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from affine import Affine
 import numpy as np
 import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
 
 from uncoverml import geoio
 from uncoverml.image import Image
@@ -151,6 +155,26 @@ def test_load_shapefile(shapefile):
         assert all(vals == i)
 
 
+def test_load_targets(mpisync, shapefile):
+    # only the root node's shapefile is read
+    _, filename = mpisync.bcast(shapefile, root=0)
+    targets = geoio.load_targets(filename, '3')
+    lonlats, vals, othervals = geoio.load_shapefile(filename, '3')
+    order = np.lexsort(lonlats.T)
+    shares = mpisync.allgather(targets)
+    assert [t.positions.shape[0] for t in shares] == \
+        [len(k) for k in np.array_split(order, mpisync.size)]
+    assert np.array_equal(np.concatenate([t.positions for t in shares]),
+                          lonlats[order])
+    assert np.array_equal(np.concatenate([t.observations for t in shares]),
+                          vals[order])
+    for t in shares:
+        assert t.fields.keys() == othervals.keys()
+    for k, v in othervals.items():
+        assert np.array_equal(np.concatenate([t.fields[k] for t in shares]),
+                              v[order])
+
+
 def test_array_image_src():
     res_x = 1000
     res_y = 500
@@ -244,3 +268,143 @@ def test_Image_split_overlap(array_image_src, num_chunks, overlap_pixels):
     Irecon = np.hstack(Ichunks)
     assert I.shape == Irecon.shape
     assert np.all(I == Irecon)
+
+
+@pytest.mark.parametrize('flipped', [True, False])
+@pytest.mark.parametrize('mask_band', [False, True])
+def test_rasterio_image_src(random_filename, flipped, mask_band):
+    res_x, res_y, nodata = 40, 30, -9999.
+    data = np.random.rand(2, res_y, res_x).astype(np.float32)
+    data[:, 3:5, 7:9] = nodata
+    data[0, 10, 11] = np.nan
+    A = Affine(1., 0, 100., 0, -1., 0.) if flipped \
+        else Affine(1., 0, 100., 0, 1., -30.)
+    filename = random_filename(ext='.tif')
+    with rasterio.open(filename, 'w', driver='GTiff', width=res_x,
+                       height=res_y, count=2, dtype=np.float32, crs=crs,
+                       transform=A, nodata=nodata) as f:
+        f.write(data)
+        if mask_band:
+            # a dataset mask takes precedence over nodata in GDAL
+            valid = np.full((res_y, res_x), 255, dtype=np.uint8)
+            valid[12:15, 6:18] = 0
+            f.write_mask(valid)
+
+    src = geoio.RasterioImageSource(filename)
+    x_min, x_max, y_min, y_max = 5, 20, 2, 25
+    d = src.data(x_min, x_max, y_min, y_max)
+    src.close()
+
+    if mask_band:
+        true_mask = np.repeat(valid[np.newaxis] == 0, 2, axis=0)
+    else:
+        true_mask = data == nodata
+    true_mask = true_mask | np.isnan(data)
+    true_data = np.transpose(data, [2, 1, 0])
+    true_mask = np.transpose(true_mask, [2, 1, 0])
+    if flipped:
+        true_data = true_data[:, ::-1]
+        true_mask = true_mask[:, ::-1]
+    true_data = true_data[x_min:x_max, y_min:y_max]
+    true_mask = true_mask[x_min:x_max, y_min:y_max]
+    assert d.shape == true_data.shape
+    assert d.data.flags.c_contiguous
+    assert np.all(d.mask == true_mask)
+    assert np.all(d.data[~true_mask] == true_data[~true_mask])
+
+
+@pytest.mark.parametrize('n_subchunks', [1, 3])
+def test_image_writer(mpisync, random_filename, n_subchunks):
+    res_x, res_y, bands = 7, 23, 2
+    # the same image on every node, each writes its rows of each partition
+    rnd = np.random.RandomState(0)
+    data = rnd.rand(res_x, res_y, bands).astype(np.float32)
+    mask = rnd.rand(res_x, res_y, bands) < 0.2
+    outpath = mpisync.bcast(random_filename(ext='_{}.tif'), root=0)
+    bbox = np.array([[100., -20.], [107., -43.]])
+    writer = geoio.ImageWriter((res_x, res_y, bands), bbox, crs, 'test',
+                               n_subchunks, outpath, band_tags=['a', 'b'])
+    rows = np.array_split(np.arange(res_y), mpisync.size * n_subchunks)
+    for s in range(n_subchunks):
+        r = rows[mpisync.size * s + mpisync.rank]
+        x = np.ma.masked_array(data[:, r].reshape(-1, bands),
+                               mask=mask[:, r].reshape(-1, bands))
+        writer.write(x, s)
+    writer.close()
+
+    assert len(writer.file_names) == bands
+    for b, filename in enumerate(writer.file_names):
+        with rasterio.open(filename) as f:
+            assert f.shape == (res_y, res_x)
+            assert f.nodata == geoio.ImageWriter.nodata_value
+            out = f.read(1)
+        true_mask = mask[:, :, b].T
+        assert np.array_equal(out == geoio.ImageWriter.nodata_value,
+                              true_mask)
+        assert np.array_equal(out[~true_mask], data[:, :, b].T[~true_mask])
+
+
+@pytest.mark.parametrize('ratio', [0.5, 1.7, 2.6])
+@pytest.mark.parametrize('resampling', [0, 1, 4, 5])
+def test_resample_bands(random_filename, monkeypatch, ratio, resampling):
+    res_x, res_y, nodata = 60, 45, -9999.
+    data = np.random.rand(2, res_y, res_x).astype(np.float32)
+    data[:, 3:5, 7:9] = nodata
+    A = Affine(1., 0, 100., 0, -1., 0.)
+    input_tif = random_filename(ext='.tif')
+    output_tif = random_filename(ext='.tif')
+    with rasterio.open(input_tif, 'w', driver='GTiff', width=res_x,
+                       height=res_y, count=2, dtype=np.float32, crs=crs,
+                       transform=A, nodata=nodata) as f:
+        f.write(data)
+
+    # a budget of a few output rows so the output is built from many bands
+    out_shape = round(res_y / ratio), round(res_x / ratio)
+    monkeypatch.setattr(geoio, '_RESAMPLE_BYTES',
+                        3 * 8 * out_shape[1] * (1 + ratio ** 2))
+    geoio.resample(input_tif, output_tif, ratio, resampling=resampling)
+
+    # the same resampling done in a single reproject of the whole raster
+    expected = np.empty((2,) + out_shape, dtype=np.float32)
+    for b in range(2):
+        reproject(data[b], expected[b], src_transform=A,
+                  dst_transform=A * Affine.scale(ratio), src_crs=crs,
+                  src_nodata=nodata, dst_crs=crs, dst_nodata=nodata,
+                  resampling=Resampling(resampling))
+    with rasterio.open(output_tif) as f:
+        assert f.shape == out_shape
+        out = f.read()
+    assert np.array_equal(out == nodata, expected == nodata)
+    if resampling in geoio._RESAMPLE_RADIUS:
+        # the band offsets can change interpolated values in the last bit
+        assert np.allclose(out, expected, rtol=1e-6, atol=0)
+    else:
+        assert np.array_equal(out, expected)
+
+
+@pytest.mark.parametrize('n', [0, 1, 10, 10000])
+def test_yx_sort_index(n):
+    lonlat = np.random.rand(n, 2) * 100 - 50
+    # exact ties in y and x, and coordinates closer than the quantization
+    lonlat[::3, 1] = lonlat[0, 1] if n else 0
+    lonlat[::7] = lonlat[::7][::-1]
+    if n > 1:
+        lonlat[1] = lonlat[0] + [1e-13, -1e-13]
+    ordind = geoio._yx_sort_index(lonlat)
+    assert np.all(ordind == np.lexsort(lonlat.T))
+
+
+@pytest.mark.parametrize('n', [0, 7, 1000])
+@pytest.mark.parametrize('frac', [0.0, 0.3, 1.0])
+def test_subsample_index(n, frac):
+    idx = geoio._subsample_index(n, frac)
+    assert idx.shape == (int(round(frac * n)),)
+    assert np.all(np.diff(idx) > 0)
+    assert np.all((idx >= 0) & (idx < n))
+    # every covariate must keep the same rows, including when extracted
+    # on separate threads
+    assert np.array_equal(idx, geoio._subsample_index(n, frac))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        others = list(executor.map(lambda _: geoio._subsample_index(n, frac),
+                                   range(8)))
+    assert all(np.array_equal(idx, o) for o in others)
@@ -1,9 +1,12 @@
 # import copy
 
+import os
+
 import numpy as np
 import pytest
 
-from uncoverml import mpiops
+from uncoverml import features, mpiops
+from uncoverml.targets import Targets, gather_targets_main
 # from uncoverml import pipeline
 # from uncoverml import transforms
 
@@ -19,6 +22,13 @@ def transform_opt(request):
     return request.param
 
 
+def test_node_cores(mpisync):
+    n = mpiops.node_cores()
+    assert 1 <= n <= (os.cpu_count() or 1)
+    # all nodes on one host split its cores between them
+    assert n * mpiops.chunks <= max(os.cpu_count() or 1, mpiops.chunks)
+
+
 def test_power(masked_array):
     x, _ = masked_array
     x2 = mpiops.power(x, 2)
@@ -66,6 +76,67 @@ def test_covariance(mpisync, masked_array):
     assert np.allclose(c_true, c)
 
 
+@pytest.mark.parametrize('mask', ['full', 'nomask', 'partial'])
+def test_pack_masked(mask):
+    # 15 elements, so the packed mask doesn't fill a whole number of bytes
+    data = np.random.rand(5, 3)
+    if mask == 'full':
+        m = np.ones(data.shape, dtype=bool)
+    elif mask == 'nomask':
+        m = np.ma.nomask
+    else:
+        m = np.random.rand(5, 3) < 0.4
+    x = np.ma.masked_array(data, mask=m)
+    y = features._unpack_masked(*features._pack_masked(x))
+    assert np.array_equal(y.data, x.data)
+    assert np.array_equal(np.ma.getmaskarray(y), np.ma.getmaskarray(x))
+
+
+def test_unpack_mixed_masks():
+    # nodes without masked values send no mask at all
+    a = np.ma.masked_array(np.random.rand(3, 2))
+    b = np.ma.masked_array(np.random.rand(4, 2),
+                           mask=np.random.rand(4, 2) < 0.5)
+    x = np.ma.vstack([features._unpack_masked(*features._pack_masked(k))
+                      for k in (a, b)])
+    assert np.array_equal(x.data, np.vstack([a.data, b.data]))
+    assert np.array_equal(np.ma.getmaskarray(x),
+                          np.vstack([np.ma.getmaskarray(a), b.mask]))
+
+
+@pytest.mark.parametrize('nomask_node', [None, 0])
+def test_gather_features(mpisync, masked_array, nomask_node):
+    x, x_all = masked_array
+    if nomask_node is not None:
+        # one node has nothing masked, so sends no mask
+        if mpiops.chunk_index == nomask_node:
+            x = np.ma.masked_array(x.data)
+        x_all = np.ma.concatenate(mpiops.comm.allgather(x), axis=0)
+    x_gathered = features.gather_features(x)
+    assert np.array_equal(x_gathered.data, x_all.data)
+    assert np.array_equal(np.ma.getmaskarray(x_gathered),
+                          np.ma.getmaskarray(x_all))
+
+
+def test_gather_targets(mpisync):
+    rnd = np.random.RandomState(mpiops.chunk_index)
+    n = 10 + mpiops.chunk_index
+    targets = Targets(rnd.rand(n, 2), rnd.rand(n),
+                      othervals={'b': rnd.randint(0, 9, n), 'a': rnd.rand(n)})
+    keep = rnd.rand(n) < 0.7
+    gathered = gather_targets_main(targets, keep, node=0)
+
+    def gather(x):
+        return np.ma.concatenate(mpiops.comm.allgather(x[keep]), axis=0)
+
+    assert np.array_equal(gathered.observations, gather(targets.observations))
+    assert np.array_equal(gathered.positions, gather(targets.positions))
+    assert list(gathered.fields) == ['a', 'b']
+    for k, v in targets.fields.items():
+        assert np.array_equal(gathered.fields[k], gather(v))
+        assert gathered.fields[k].dtype == v.dtype
+
+
 class DummySettings:
     def __init__(self):
         pass
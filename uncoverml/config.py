@@ -207,6 +207,9 @@ class Config(object):
         Optional creation options passed to the geotiff output driver.
         See https://gdal.org/drivers/raster/gtiff.html#creation-options
         for a list of creation options. Default value is empty dict.
+        Options not given here fall back to the tiled 256x256,
+        BIGTIFF=IF_SAFER, NUM_THREADS=ALL_CPUS defaults of
+        :class:`~uncoverml.geoio.ImageWriter`.
     outbands : int
         The outbands to write in the prediction output file. Used as
         the 'stop' for a slice taken from list of prediction tags,
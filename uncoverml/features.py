@@ -87,7 +87,8 @@ def transform_features(feature_sets, transform_sets, final_transform, config):
         if mpiops.chunk_index == 0 \
                 and config.pk_featurevec and not os.path.exists(config.pk_featurevec):
             log.info('Saving featurevec for reuse')
-            pickle.dump(feature_vec, open(config.pk_featurevec, 'wb'))
+            pickle.dump(feature_vec, open(config.pk_featurevec, 'wb'),
+                        protocol=pickle.HIGHEST_PROTOCOL)
 
     x = np.ma.concatenate(transformed_vectors, axis=1)
     if config.cubist or config.multicubist or config.krige:
@@ -172,11 +173,31 @@ def cull_all_null_rows(feature_sets):
     return rows_to_keep
 
 
+def _pack_masked(x):
+    """
+    Split a masked array into its data and a bit-packed mask (or None if
+    nothing is masked) so the mask costs 1 bit per element in transport
+    """
+    mask = np.ma.getmask(x)
+    packed_mask = None if mask is np.ma.nomask \
+        else np.packbits(mask, axis=None)
+    return np.ma.getdata(x), packed_mask
+
+
+def _unpack_masked(data, packed_mask):
+    if packed_mask is None:
+        return np.ma.masked_array(data)
+    mask = np.unpackbits(packed_mask, count=data.size).reshape(data.shape)
+    return np.ma.masked_array(data, mask=mask.astype(bool))
+
+
 def gather_features(x, node=None):
+    packed = _pack_masked(x)
     if node:
-        x_all = np.ma.vstack(mpiops.comm.gather(x, root=node))
+        all_packed = mpiops.comm.gather(packed, root=node)
     else:
-        x_all = np.ma.vstack(mpiops.comm.allgather(x))
+        all_packed = mpiops.comm.allgather(packed)
+    x_all = np.ma.vstack([_unpack_masked(*p) for p in all_packed])
     return x_all
 
 
@@ -2,13 +2,19 @@ from __future__ import division
 
 import os.path
 import os
+import math
 import logging
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import json
 import pickle
 import matplotlib.pyplot as plt
 import rasterio
+from rasterio import windows
+from rasterio.enums import MaskFlags, Resampling
 from rasterio.warp import reproject
 from affine import Affine
 import numpy as np
@@ -76,9 +82,13 @@ class RasterioImageSource(ImageSource):
     def __init__(self, filename):
 
         self._filename = filename
+        # dataset handle for windowed reads, opened lazily in data() so that
+        # it is created after any fork and reused across windows
+        self._geotiff = None
         assert os.path.isfile(filename), '{} does not exist'.format(filename)
         with rasterio.open(self._filename, 'r') as geotiff:
             self._full_res = (geotiff.width, geotiff.height, geotiff.count)
+            self._width, self._height = geotiff.width, geotiff.height
             self._nodata_value = geotiff.meta['nodata']
             # we don't support different channels with different dtypes
             for d in geotiff.dtypes[1:]:
@@ -87,6 +97,30 @@ class RasterioImageSource(ImageSource):
                                      "with differently typed channels")
             self._dtype = np.dtype(geotiff.dtypes[0])
             self._crs = geotiff.crs
+            # masks are computed directly from a nodata value shared by all
+            # bands when that is all GDAL would use, otherwise from the
+            # dataset masks (alpha, mask band), which take precedence
+            nodatavals = set(geotiff.nodatavals)
+            self._mask_from_nodata = len(nodatavals) == 1 \
+                and self._nodata_value is not None \
+                and all(list(f) == [MaskFlags.nodata]
+                        for f in geotiff.mask_flag_enums)
+            if self._mask_from_nodata \
+                    and np.issubdtype(self._dtype, np.floating):
+                # compare at the precision the data is stored in, as GDAL does
+                self._nodata_cmp = self._dtype.type(self._nodata_value)
+            else:
+                self._nodata_cmp = self._nodata_value
+            # only floating point rasters can hold nans, and when nan is
+            # itself the nodata value the nodata mask already covers them
+            self._nan_nodata = self._mask_from_nodata \
+                and np.issubdtype(self._dtype, np.floating) \
+                and np.isnan(self._nodata_cmp)
+            self._check_nan = np.issubdtype(self._dtype, np.floating) \
+                and not self._nan_nodata
+            if not geotiff.profile.get('tiled', False):
+                log.debug("{} is not tiled, windowed reads will load whole "
+                          "strips".format(filename))
 
             A = geotiff.transform
             # No shearing or rotation allowed!!
@@ -106,30 +140,40 @@ class RasterioImageSource(ImageSource):
     def data(self, min_x, max_x, min_y, max_y):
 
         if self._y_flipped:
-            min_y_new = self._full_res[1] - max_y
-            max_y_new = self._full_res[1] - min_y
-            min_y = min_y_new
-            max_y = max_y_new
+            min_y, max_y = self._height - max_y, self._height - min_y
 
         # NOTE these are exclusive
-        window = ((min_y, max_y), (min_x, max_x))
-        with rasterio.open(self._filename, 'r') as geotiff:
-            d = geotiff.read(window=window, masked=True)
-        d = d[np.newaxis, :, :] if d.ndim == 2 else d
-        d = np.ma.transpose(d, [2, 1, 0])  # Transpose and channels at back
+        # a Window directly, rasterio would otherwise convert a tuple
+        window = windows.Window(min_x, min_y, max_x - min_x, max_y - min_y)
+        if self._geotiff is None:
+            self._geotiff = rasterio.open(self._filename, 'r', sharing=False)
+        # read data and mask as plain arrays, only the result is masked
+        data = self._geotiff.read(window=window)
+        if self._nan_nodata:
+            mask = np.isnan(data)
+        elif self._mask_from_nodata:
+            mask = np.equal(data, self._nodata_cmp)
+        else:
+            mask = self._geotiff.read_masks(window=window) == 0
+        # Transpose and channels at back, these are views
+        data = np.transpose(data, [2, 1, 0])
+        mask = np.transpose(mask, [2, 1, 0])
 
         # if nans exist in data, mask them, i.e. convert to nodatavalue
         # TODO: Consider removal once covariates are fixed
-        nans = np.isnan(d.data)
-        if d.mask.ndim:
-            d.mask[nans] = True
+        if self._check_nan:
+            # mask is a view of a freshly read array so update it in place
+            np.logical_or(mask, np.isnan(data), out=mask)
 
         if self._y_flipped:
-            d = d[:, ::-1]
+            data = data[:, ::-1]
+            mask = mask[:, ::-1]
 
-        # Otherwise scikit image complains
-        m = np.ma.MaskedArray(data=np.ascontiguousarray(d.data),
-                              mask=np.ascontiguousarray(d.mask))
+        # Otherwise scikit image complains. np.require only copies when the
+        # transposed/flipped view is not already C ordered
+        m = np.ma.MaskedArray(data=np.require(data, requirements='C'),
+                              mask=np.require(mask, requirements='C'),
+                              copy=False)
 
         # # uniform mask format
         # if np.ma.count_masked(m) == 0:
@@ -139,6 +183,17 @@ class RasterioImageSource(ImageSource):
         assert m.mask.ndim == 3 or m.mask.ndim == 0
         return m
 
+    def close(self):
+        if self._geotiff is not None:
+            self._geotiff.close()
+            self._geotiff = None
+
+    def __getstate__(self):
+        # open dataset handles can't be pickled or shared across processes
+        state = self.__dict__.copy()
+        state['_geotiff'] = None
+        return state
+
 
 class ArrayImageSource(ImageSource):
     """
@@ -180,9 +235,11 @@ def load_shapefile(filename, targetfield):
     dtype_flags = [(f[1], f[2]) for f in sf.fields[1:]]  # Skip DeletionFlag
     dtypes = ['float' if (k[0] == 'N' or k[0] == 'F') else '<U{}'.format(k[1])
               for k in dtype_flags]
-    records = np.array(sf.records()).T
-    record_dict = {k: np.array(r, dtype=d) for k, r, d in zip(
-        shapefields, records, dtypes)}
+    # transpose the streamed records into one typed array per field rather
+    # than first building a single string array of every record
+    columns = list(zip(*sf.iterRecords())) or [()] * len(shapefields)
+    record_dict = {k: np.array(c, dtype=d) for k, c, d in zip(
+        shapefields, columns, dtypes)}
     if targetfield in record_dict:
         val = record_dict.pop(targetfield)
     else:
@@ -192,14 +249,14 @@ def load_shapefile(filename, targetfield):
 
     # Try to get CRS.
     prj_file = os.path.splitext(filename)[0] + '.prj'
-    src_prj, dst_prj = None, None
+    src_crs, dst_crs = None, None
     if os.path.exists(prj_file):
         with open(prj_file, 'r') as f:
             wkt = f.readline()
         if pyproj.crs.is_wkt(wkt):
-            src_prj = pyproj.Proj(pyproj.CRS(wkt))
-            if src_prj.crs.to_epsg() != 4326:
-                dst_prj = pyproj.Proj('EPSG:4326')
+            src_crs = pyproj.CRS(wkt)
+            if src_crs.to_epsg() != 4326:
+                dst_crs = pyproj.CRS('EPSG:4326')
         else:
             log.warning("Found a '.prj' file for target shapefile but text contained is not in "
                         "'wkt' format. Continuing without reprojecting.")
@@ -209,15 +266,61 @@ def load_shapefile(filename, targetfield):
         
 
     # Get coordinates
-    coords = []
-    for shape in sf.iterShapes():
-        coords.append(list(shape.__geo_interface__['coordinates']))
-    label_coords = np.array(coords).squeeze()
-    if src_prj and dst_prj:
-        label_coords = np.array([x for x in pyproj.itransform(src_prj, dst_prj, label_coords, always_xy=True)])
+    if sf.shapeType in (shapefile.POINT, shapefile.POINTZ, shapefile.POINTM):
+        # take x, y straight from each point rather than building a
+        # __geo_interface__ dict and list per shape
+        coords = itertools.chain.from_iterable(
+            shape.points[0][:2] for shape in sf.iterShapes())
+        label_coords = np.fromiter(coords, dtype=float).reshape(-1, 2)
+    else:
+        coords = []
+        for shape in sf.iterShapes():
+            coords.append(list(shape.__geo_interface__['coordinates']))
+        label_coords = np.array(coords).squeeze()
+    if src_crs and dst_crs:
+        # reproject all points in one call rather than point by point
+        transformer = pyproj.Transformer.from_crs(src_crs, dst_crs,
+                                                  always_xy=True)
+        lons, lats = transformer.transform(label_coords[:, 0],
+                                           label_coords[:, 1])
+        label_coords = np.stack((lons, lats), axis=1)
     return label_coords, val, othervals
 
 
+def _yx_sort_index(lonlat):
+    """
+    Indices that sort lonlat by y then x, the same as np.lexsort(lonlat.T),
+    found with a single sort on a 64 bit key packing the quantized y and x
+    """
+    if lonlat.shape[0] == 0:
+        return np.arange(0)
+    qmax = 2**32 - 1
+    q = np.empty(lonlat.shape, dtype=np.uint64)
+    for i in range(2):
+        v = lonlat[:, i]
+        vmin, vmax = v.min(), v.max()
+        scale = qmax / (vmax - vmin) if vmax > vmin else 0.
+        q[:, i] = np.minimum(np.floor((v - vmin) * scale), qmax)
+    key = (q[:, 1] << np.uint64(32)) | q[:, 0]
+    ordind = np.argsort(key, kind='stable')
+
+    # quantizing may have merged nearly equal coordinates. Runs of equal
+    # quantized y are contiguous and correctly ordered between themselves,
+    # so only re-sort exactly the runs that came out of order
+    x, y, yq = lonlat[ordind, 0], lonlat[ordind, 1], q[ordind, 1]
+    dy = np.diff(y)
+    bad = (dy < 0) | ((dy == 0) & (np.diff(x) < 0))
+    if np.any(bad):
+        bad_yq = np.unique(yq[1:][bad])
+        bounds = np.zeros(len(ordind) + 1, dtype=int)
+        np.add.at(bounds, np.searchsorted(yq, bad_yq, 'left'), 1)
+        np.add.at(bounds, np.searchsorted(yq, bad_yq, 'right'), -1)
+        redo = np.cumsum(bounds[:-1]) > 0
+        sub = ordind[redo]
+        ordind[redo] = sub[np.lexsort(lonlat[sub].T)]
+    return ordind
+
+
 def load_targets(shapefile, targetfield):
     """
     Loads the shapefile onto node 0 then distributes it across all
@@ -226,24 +329,26 @@ def load_targets(shapefile, targetfield):
     if mpiops.chunk_index == 0:
         lonlat, vals, othervals = load_shapefile(shapefile, targetfield)
         # sort by y then x
-        ordind = np.lexsort(lonlat.T)
+        ordind = _yx_sort_index(lonlat)
         vals = vals[ordind]
         lonlat = lonlat[ordind]
         for k, v in othervals.items():
             othervals[k] = v[ordind]
 
-        lonlat = np.array_split(lonlat, mpiops.chunks)
-        vals = np.array_split(vals, mpiops.chunks)
-        split_othervals = {k: np.array_split(v, mpiops.chunks)
-                           for k, v in othervals.items()}
-        othervals = [{k: v[i] for k, v in split_othervals.items()}
-                     for i in range(mpiops.chunks)]
+        # one (lonlat, vals, othervals) share per node so the targets go
+        # out in a single scatter rather than one per array, split as
+        # np.array_split would
+        n = lonlat.shape[0]
+        sizes = np.full(mpiops.chunks, n // mpiops.chunks)
+        sizes[:n % mpiops.chunks] += 1
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        shares = [(lonlat[a:b], vals[a:b],
+                   {k: v[a:b] for k, v in othervals.items()})
+                  for a, b in zip(bounds[:-1], bounds[1:])]
     else:
-        lonlat, vals, othervals = None, None, None
+        shares = None
 
-    lonlat = mpiops.comm.scatter(lonlat, root=0)
-    vals = mpiops.comm.scatter(vals, root=0)
-    othervals = mpiops.comm.scatter(othervals, root=0)
+    lonlat, vals, othervals = mpiops.comm.scatter(shares, root=0)
     log.info("Node {} has been assigned {} targets".format(mpiops.chunk_index,
                                                            lonlat.shape[0]))
     targets = Targets(lonlat, vals, othervals=othervals)
@@ -254,7 +359,7 @@ def get_image_spec(model, config):
     # temp workaround, we should have an image spec to check against
     nchannels = len(model.get_predict_tags())
     imagelike = config.feature_sets[0].files[0]
-    template_image = image.Image(RasterioImageSource(imagelike))
+    template_image = image.Image(_source(imagelike))
     eff_shape = template_image.patched_shape(config.patchsize) + (nchannels,)
     eff_bbox = template_image.patched_bbox(config.patchsize)
     crs = template_image.crs
@@ -264,12 +369,18 @@ def get_image_spec(model, config):
 class ImageWriter:
 
     nodata_value = np.array(-1e20, dtype='float32')
+    # creation options used unless the same option is given in kwargs
+    default_options = dict(tiled=True, blockxsize=256, blockysize=256,
+                           BIGTIFF='IF_SAFER', NUM_THREADS='ALL_CPUS')
 
     def __init__(self, shape, bbox, crs, name, n_subchunks, outpath,
                  band_tags=None, independent=False, **kwargs):
         """
         pass in additional geotif write options in kwargs
         """
+        given = {k.lower() for k in kwargs}
+        kwargs.update({k: v for k, v in self.default_options.items()
+                       if k.lower() not in given})
         # affine
         self.A, _, _ = image.bbox2affine(bbox[1, 0], bbox[0, 0],
                                          bbox[0, 1], bbox[1, 1],
@@ -334,38 +445,61 @@ class ImageWriter:
         rows = self.shape[0]
         bands = x.shape[1]
 
-        image = x.reshape((rows, -1, bands))
-        # make sure we're writing nodatavals
-        if x.mask is not False:
-            x.data[x.mask] = self.nodata_value
+        # make sure we're writing nodatavals, after which the mask is
+        # carried by the data and only the plain array is needed
+        data = np.ma.getdata(x)
+        mask = np.ma.getmask(x)
+        if mask is not np.ma.nomask:
+            np.putmask(data, mask, self.nodata_value)
+        image = data.reshape((rows, -1, bands))
 
         mpiops.comm.barrier()
         log.info("Writing partition to output file")
 
         if self.independent:
-            data = np.ma.transpose(image, [2, 1, 0])  # untranspose
-            # write each band separately
-            for i, f in enumerate(self.files):
-                f.write(data[i:i+1])
+            data = np.transpose(image, [2, 1, 0])  # untranspose
+            self._write_bands([(data, None)])
         else:
-            if mpiops.chunk_index != 0:
-                mpiops.comm.send(image, dest=0)
+            # exchange shapes first so the data travels as raw float32
+            # buffers, collected on rank 0 by a single Gatherv
+            shapes = mpiops.comm.gather(image.shape, root=0)
+            if mpiops.chunk_index == 0:
+                counts = [int(np.prod(k)) for k in shapes]
+                displs = np.cumsum([0] + counts[:-1]).tolist()
+                recvbuf = np.empty(sum(counts), dtype=np.float32)
+                recv = [recvbuf, (counts, displs)]
             else:
+                recv = None
+            mpiops.comm.Gatherv(np.ascontiguousarray(image), recv, root=0)
+
+            if mpiops.chunk_index == 0:
+                pieces = []
                 for node in range(mpiops.chunks):
-                    node = mpiops.chunks - node - 1
                     subindex = mpiops.chunks*subchunk_index + node
                     ystart = self.sub_starts[subindex]
-                    data = mpiops.comm.recv(source=node) \
-                        if node != 0 else image
-                    data = np.ma.transpose(data, [2, 1, 0])  # untranspose
+                    data = recvbuf[displs[node]:displs[node] + counts[node]]
+                    data = data.reshape(shapes[node])
+                    data = np.transpose(data, [2, 1, 0])  # untranspose
                     yend = ystart + data.shape[1]  # this is Y
                     window = ((ystart, yend), (0, self.shape[0]))
-                    # write each band separately
-                    for i, f in enumerate(self.files):
-                        f.write(data[i:i+1], window=window)
+                    pieces.append((data, window))
+                self._write_bands(pieces)
 
         mpiops.comm.barrier()
 
+    def _write_bands(self, pieces):
+        """
+        Write each (data, window) piece to every band file. The bands are
+        separate datasets, so each one is written from its own thread
+        """
+        def write_band(i):
+            for data, window in pieces:
+                self.files[i].write(data[i:i+1], window=window)
+
+        n_threads = max(1, len(self.files))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(write_band, range(len(self.files))))
+
     def close(self):  # we can explicitly close rasters using this
         if mpiops.chunk_index == 0:
             for f in self.files:
@@ -394,15 +528,40 @@ def feature_names(config):
     return results
 
 
+@functools.lru_cache(maxsize=None)
+def _cached_source(filename):
+    return RasterioImageSource(filename)
+
+
+def _source(tif):
+    """
+    The RasterioImageSource for tif, shared across the pipeline phases so
+    each covariate is opened and its header parsed only once per process
+    """
+    return _cached_source(os.path.abspath(tif))
+
+
 def _iterate_sources(f, config):
 
+    def extract(tif):
+        return f(_source(tif))
+
     results = []
     for s in config.feature_sets:
         extracted_chunks = {}
+        # GDAL releases the GIL while reading so extract the files
+        # concurrently, but keep the MPI reductions below on this thread and
+        # in file order so every node issues them identically. Each distinct
+        # file is extracted once, so no two threads share a cached source
+        # (dataset handles aren't thread safe). Every thread holds its own
+        # file's read temporaries, so only use this node's share of the cores
+        paths = list(OrderedDict.fromkeys(os.path.abspath(t) for t in s.files))
+        n_threads = max(1, min(len(paths), mpiops.node_cores()))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            extracted = dict(zip(paths, executor.map(extract, paths)))
         for tif in s.files:
+            x = extracted[os.path.abspath(tif)]
             name = os.path.basename(tif)
-            image_source = RasterioImageSource(tif)
-            x = f(image_source)
             # TODO this may hurt performance. Consider removal
             if type(x) is np.ma.MaskedArray:
                 count = mpiops.count(x)
@@ -410,9 +569,8 @@ def _iterate_sources(f, config):
                 #     s = ("{} has no data in at least one band.".format(name) +
                 #          " Valid_pixel_count: {}".format(count))
                 #     raise ValueError(s)
-                missing_percent = missing_percentage(x)
-                t_missing = mpiops.comm.allreduce(
-                    missing_percent) / mpiops.chunks
+                # already a total over all nodes
+                t_missing = missing_percentage(x, count)
                 log.info("{}: {}px {:2.2f}% missing".format(
                     name, count, t_missing))
             extracted_chunks[name] = x
@@ -452,6 +610,17 @@ def image_feature_sets(targets, config):
     return result
 
 
+def _subsample_index(n, frac):
+    """
+    Sorted indices of a fixed random subset of round(frac * n) of n rows.
+    The generator is local and always seeded the same way, so every
+    covariate keeps the same rows even when extracted on separate threads
+    """
+    k = int(round(frac * n))
+    rng = np.random.default_rng(1)
+    return np.sort(rng.choice(n, size=k, replace=False))
+
+
 def semisupervised_feature_sets(targets, config):
 
     frac = config.subsample_fraction
@@ -462,13 +631,24 @@ def semisupervised_feature_sets(targets, config):
         r_a = features.extract_subchunks(image_source, subchunk_index=0,
                                          n_subchunks=1,
                                          patchsize=config.patchsize)
+        n_t = r_t.shape[0]
         if frac < 1.0:
-            np.random.seed(1)
-            r_a = r_a[np.random.rand(r_a.shape[0]) < frac]
-
-        r_data = np.concatenate([r_t.data, r_a.data], axis=0)
-        r_mask = np.concatenate([r_t.mask, r_a.mask], axis=0)
-        r = np.ma.masked_array(data=r_data, mask=r_mask)
+            idx = _subsample_index(r_a.shape[0], frac)
+        else:
+            idx = np.arange(r_a.shape[0])
+
+        # fill one preallocated buffer each for data and mask, taking the
+        # subsampled rows straight into place (indices are in range, and
+        # mode='raise' would buffer the output)
+        shape = (n_t + idx.shape[0],) + r_a.shape[1:]
+        r_data = np.empty(shape, dtype=r_a.dtype)
+        r_mask = np.empty(shape, dtype=bool)
+        r_data[:n_t] = r_t.data
+        r_mask[:n_t] = np.ma.getmaskarray(r_t)
+        np.take(r_a.data, idx, axis=0, out=r_data[n_t:], mode='clip')
+        np.take(np.ma.getmaskarray(r_a), idx, axis=0, out=r_mask[n_t:],
+                mode='clip')
+        r = np.ma.masked_array(data=r_data, mask=r_mask, copy=False)
         return r
     result = _iterate_sources(f, config)
     return result
@@ -481,8 +661,7 @@ def unsupervised_feature_sets(config):
                                        n_subchunks=1,
                                        patchsize=config.patchsize)
         if frac < 1.0:
-            np.random.seed(1)
-            r = r[np.random.rand(r.shape[0]) < frac]
+            r = r[_subsample_index(r.shape[0], frac)]
         return r
     result = _iterate_sources(f, config)
     return result
@@ -514,7 +693,7 @@ def export_feature_ranks(measures, feats, scores, config):
 
 def export_model(model, config):
     with open(config.model_file, 'wb') as f:
-        pickle.dump(model, f)
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 def export_crossval(crossval_output, config):
     # Make sure we convert numpy arrays to lists
@@ -546,6 +725,14 @@ def _make_valid_array_name(label):
         label = '_' + label
     return label
 
+# approximate memory budget in bytes for each band of rows in resample
+_RESAMPLE_BYTES = 256 * 1024 ** 2
+# support radius in source pixels of the interpolating kernels in resample,
+# GDAL widens it by the ratio when shrinking. The other methods only use the
+# source pixels under each output pixel
+_RESAMPLE_RADIUS = {1: 1, 2: 2, 3: 2, 4: 3}
+
+
 def resample(input_tif, output_tif, ratio, resampling=5):
     """
     Parameters
@@ -566,7 +753,7 @@ def resample(input_tif, output_tif, ratio, resampling=5):
         lanczos = 4
         average = 5
         mode = 6
-        gauss = 7
+        gauss = 7 (not supported by reproject)
         max = 8
         min = 9
         med = 10
@@ -587,17 +774,41 @@ def resample(input_tif, output_tif, ratio, resampling=5):
                          crs=src.crs, transform=newaff,
                          nodata=nodatavals[0])
 
+    # reproject whole-width bands of output rows sized to keep the source
+    # and output arrays of a band within a fixed budget, so that memory use
+    # doesn't grow with the size of the input raster. Whole bands rather
+    # than dest's one-row strips keep the number of reproject calls small
+    src_full = windows.Window(0, 0, src.width, src.height)
+    # source pixels around each band so every kernel is whole at the seams
+    pad = math.ceil(_RESAMPLE_RADIUS.get(resampling, 0) * max(ratio, 1)) + 1
+    row_bytes = 8 * dest.width * (1 + ratio ** 2)
+    band_rows = int(max(1, min(dest.height, _RESAMPLE_BYTES // row_bytes)))
     for b in range(src.count):
-        arr = src.read(b+1)
-        new_arr = np.empty(shape=new_shape, dtype=arr.dtype)
-        reproject(arr, new_arr,
-                  src_transform=aff,
-                  dst_transform=newaff,
-                  src_crs=src.crs,
-                  src_nodata=nodatavals[b],
-                  dst_crs=src.crs,
-                  dst_nodata=nodatavals[b],
-                  resample=resampling)
-        dest.write(new_arr, b + 1)
+        for row in range(0, dest.height, band_rows):
+            window = windows.Window(0, row, dest.width,
+                                    min(band_rows, dest.height - row))
+            src_window = windows.from_bounds(*dest.window_bounds(window),
+                                             transform=aff)
+            col_off = math.floor(src_window.col_off) - pad
+            row_off = math.floor(src_window.row_off) - pad
+            src_window = windows.Window(
+                col_off, row_off,
+                math.ceil(src_window.col_off + src_window.width) + pad
+                - col_off,
+                math.ceil(src_window.row_off + src_window.height) + pad
+                - row_off)
+            src_window = windows.intersection(src_window, src_full)
+            arr = src.read(b+1, window=src_window)
+            new_arr = np.empty(shape=(window.height, window.width),
+                               dtype=arr.dtype)
+            reproject(arr, new_arr,
+                      src_transform=src.window_transform(src_window),
+                      dst_transform=dest.window_transform(window),
+                      src_crs=src.crs,
+                      src_nodata=nodatavals[b],
+                      dst_crs=src.crs,
+                      dst_nodata=nodatavals[b],
+                      resampling=Resampling(resampling))
+            dest.write(new_arr, b + 1, window=window)
     src.close()
     dest.close()
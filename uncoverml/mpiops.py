@@ -1,4 +1,6 @@
+import functools
 import logging
+import os
 import pickle
 
 import numpy as np
@@ -50,6 +52,29 @@ def run_once(f, *args, **kwargs):
     return result
 
 
+@functools.lru_cache(maxsize=None)
+def node_cores():
+    """Number of CPU cores this node can use without oversubscription
+    The cores this process is bound to are shared out between the nodes
+    on the same host that are bound to any of the same cores, so unbound
+    nodes split the host between them. Collective on the first call, the
+    result is then cached
+    Returns
+    -------
+    int
+        At least 1
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cores = frozenset(os.sched_getaffinity(0))
+    else:
+        cores = frozenset(range(os.cpu_count() or 1))
+    host_comm = comm.Split_type(MPI.COMM_TYPE_SHARED)
+    host_cores = host_comm.allgather(cores)
+    host_comm.Free()
+    sharing = sum(1 for c in host_cores if c & cores)
+    return max(1, len(cores) // sharing)
+
+
 def sum_axis_0(x, y, dtype):
     s = np.ma.sum(np.ma.vstack((x, y)), axis=0)
     return s
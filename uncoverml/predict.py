@@ -144,8 +144,10 @@ def _get_data(subchunk, config):
     # which is ok as we just need dummies here
     if config.mask:
         mask_x = _mask(subchunk, config)
-        all_mask_x = np.ma.vstack(mpiops.comm.allgather(mask_x))
-        if all_mask_x.shape[0] == np.sum(all_mask_x.mask):
+        # only the counts are needed to tell if the partition is all masked
+        n_masked, n_total = mpiops.comm.allreduce(
+            np.array([np.sum(mask_x.mask), mask_x.shape[0]]))
+        if n_total == n_masked:
             x = np.ma.zeros((mask_x.shape[0], len(features_names)),
                             dtype=np.bool)
             x.mask = True
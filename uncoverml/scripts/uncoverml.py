@@ -122,9 +122,11 @@ def _load_data(config, partitions):
         # Pickle data if requested.
         if ls.mpiops.chunk_index == 0:
             if config.pk_covariates and not os.path.exists(config.pk_covariates):
-                pickle.dump(x_all, open(config.pk_covariates, 'wb'))
+                pickle.dump(x_all, open(config.pk_covariates, 'wb'),
+                            protocol=pickle.HIGHEST_PROTOCOL)
             if config.pk_targets and not os.path.exists(config.pk_targets):
-                pickle.dump(targets_all, open(config.pk_targets, 'wb'))
+                pickle.dump(targets_all, open(config.pk_targets, 'wb'),
+                            protocol=pickle.HIGHEST_PROTOCOL)
 
     return targets_all, x_all
 
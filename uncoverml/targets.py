@@ -23,31 +23,21 @@ def gather_targets(targets, keep, config, node=None):
 
 
 def gather_targets_main(targets, keep, node):
-    observations = targets.observations[keep]
-    positions = targets.positions[keep]
+    # send each node's targets as one object so there is a single
+    # collective rather than one per array and field
+    keys = sorted(list(targets.fields.keys()))
+    share = (targets.observations[keep], targets.positions[keep],
+             [targets.fields[k][keep] for k in keys])
     if node:
-        y = np.ma.concatenate(mpiops.comm.gather(observations,
-                                                 root=node), axis=0)
-        p = np.ma.concatenate(mpiops.comm.gather(positions,
-                                                 root=node),
-                              axis=0)
-        d = {}
-        keys = sorted(list(targets.fields.keys()))
-        for k in keys:
-            d[k] = np.ma.concatenate(
-                mpiops.comm.gather(targets.fields[k][keep], root=node), axis=0)
-        result = Targets(p, y, othervals=d)
+        shares = mpiops.comm.gather(share, root=node)
     else:
-        y = np.ma.concatenate(mpiops.comm.allgather(
-            observations), axis=0)
-        p = np.ma.concatenate(mpiops.comm.allgather(positions),
-                              axis=0)
-        d = {}
-        keys = sorted(list(targets.fields.keys()))
-        for k in keys:
-            d[k] = np.ma.concatenate(
-                mpiops.comm.allgather(targets.fields[k][keep]), axis=0)
-        result = Targets(p, y, othervals=d)
+        shares = mpiops.comm.allgather(share)
+    y = np.ma.concatenate([s[0] for s in shares], axis=0)
+    p = np.ma.concatenate([s[1] for s in shares], axis=0)
+    d = {}
+    for i, k in enumerate(keys):
+        d[k] = np.ma.concatenate([s[2][i] for s in shares], axis=0)
+    result = Targets(p, y, othervals=d)
     return result
 
 
@@ -18,10 +18,13 @@ def build_feature_vector(image_chunks, is_categorical):
     return x
 
 
-def missing_percentage(x):
-    x_n = np.sum(mpiops.count(x))
-    x_full_local = np.product(x.shape)
-    x_full = mpiops.comm.allreduce(x_full_local)
+def missing_percentage(x, x_count=None):
+    """
+    Percentage of x that is masked across all nodes. Pass x_count, the
+    result of mpiops.count(x), if it is already known to save recounting
+    """
+    x_n = np.sum(mpiops.count(x) if x_count is None else x_count)
+    x_full = mpiops.comm.allreduce(x.size)
     missing = (1.0 - x_n / x_full) * 100.0
     return missing
 